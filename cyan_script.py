@@ -1,8 +1,19 @@
 #!/usr/bin/env python3
+import copy
+import functools
+import hashlib
+import importlib.metadata
+import importlib.util
+import itertools
 import os
+import pickle
 import re
 import sys
+import tempfile
 import warnings
+import weakref
+from typing import Optional
+from xml.sax.saxutils import escape
 
 warnings.filterwarnings(
     "ignore",
@@ -10,13 +21,13 @@ warnings.filterwarnings(
     category=UserWarning,
 )
 
-from docxtpl import DocxTemplate
-from docx.shared import Cm, Pt
+from docx.shared import Cm, Emu, Pt
+from docx.enum.style import WD_STYLE_TYPE
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
-from markdown import markdown
-from bs4 import BeautifulSoup, NavigableString
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.styles import BabelFish
+from lxml import etree
 
 _HEADING_NUM_PATTERNS = [
     r"^\s*第\s*([0-9]+|[一二三四五六七八九十百千]+)\s*(章|节|部分|篇)\s*[:：、\.\s]*",
@@ -24,6 +35,29 @@ _HEADING_NUM_PATTERNS = [
     r"^\s*\d+(?:\.\d+)+\s*[\.\)]?\s*",
     r"^\s*\d+\s*[、\.\)]\s*",
 ]
+# _HEADING_NUM_RXS[k] 是第 k 个及之后各模式的合并分支（命名组 h<i>），
+# 每个模式最多按顺序剥离一次，与逐个 re.sub 的结果一致
+_HEADING_NUM_RXS = [
+    re.compile("|".join(f"(?P<h{i}>{p})" for i, p in enumerate(_HEADING_NUM_PATTERNS) if i >= start))
+    for start in range(len(_HEADING_NUM_PATTERNS))
+]
+
+_TABLE_CAPTION_RX = re.compile(r"^表\s*\d+\s+.+")
+
+_IMG_EXT_RX = re.compile(r"\.(?:png|jpe?g|gif|bmp|webp)$", re.IGNORECASE)
+
+_NEWLINE_RX = re.compile(r"\r\n|\r|\n")
+_RUN_BREAK_RX = re.compile(r"(\t|\r\n|\n|\r)")
+
+# Windows 文件名中不允许出现的字符
+_SAFE_FILENAME_TABLE = str.maketrans({c: "_" for c in '\\/:*?"<>|'})
+
+_HEADING_STYLE = {
+    "h1": "heading 1",
+    "h2": "heading 2",
+    "h3": "heading 3",
+    "h4": "heading 4",
+}
 
 _STYLE_ALIASES = {
     "heading 1": ["heading 1", "Heading 1", "标题 1"],
@@ -62,19 +96,31 @@ _STYLE_ALIASES = {
     "Caption": ["Caption", "题注", "图注"],
 }
 
+_STYLE_NAME_CACHE: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_RUN_PROPS_CACHE: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cyanscript")
+
+_MD_CACHE: dict[tuple[str, str, int, int], str] = {}
+
 
 def strip_heading_number(text: str) -> str:
     if not text:
         return text
     s = text.strip()
-    for pat in _HEADING_NUM_PATTERNS:
-        s_new = re.sub(pat, "", s).strip()
-        if s_new != s:
-            s = s_new
+    start = 0
+    while start < len(_HEADING_NUM_RXS):
+        m = _HEADING_NUM_RXS[start].match(s)
+        if not m:
+            break
+        s = s[m.end():].strip()
+        # 下一轮只接受比本次命中更靠后的模式
+        start = int(m.lastgroup[1:]) + 1
     return s
 
 
-def _iter_style_candidates(style_names: list[str]) -> list[str]:
+@functools.lru_cache(maxsize=256)
+def _iter_style_candidates(style_names: tuple[str, ...]) -> tuple[str, ...]:
     candidates = []
     seen = set()
     for name in style_names:
@@ -82,17 +128,96 @@ def _iter_style_candidates(style_names: list[str]) -> list[str]:
             if alias not in seen:
                 candidates.append(alias)
                 seen.add(alias)
-    return candidates
+    return tuple(candidates)
+
+
+def _available_styles(part) -> set[str]:
+    """样式名与样式 ID 集合，每个文档部件只解析一次。"""
+    names = _STYLE_NAME_CACHE.get(part)
+    if names is None:
+        names = set()
+        for style in part.styles:
+            names.add(style.element.name_val)
+            names.add(style.style_id)
+        _STYLE_NAME_CACHE[part] = names
+    return names
 
 
-def apply_style(obj, style_names: list[str]) -> bool:
+def _first_available_style(part, style_names: tuple[str, ...]):
+    available = _available_styles(part)
     for name in _iter_style_candidates(style_names):
-        try:
-            obj.style = name
-            return True
-        except KeyError:
-            continue
-    return False
+        if name in available or BabelFish.ui2internal(name) in available:
+            return name
+    return None
+
+
+def apply_style(obj, style_names: tuple[str, ...]) -> bool:
+    name = _first_available_style(obj.part, style_names)
+    if name is None:
+        return False
+    obj.style = name
+    return True
+
+
+def _resolve_style_id(part, style_names: tuple[str, ...], style_type):
+    name = _first_available_style(part, style_names)
+    return part.get_style_id(name, style_type) if name else None
+
+
+def _run_properties(part, style_names: tuple[str, ...]):
+    """字符样式对应的 w:rPr 模板，按文档部件缓存；无可用样式时为 None。"""
+    cache = _RUN_PROPS_CACHE.setdefault(part, {})
+    if style_names not in cache:
+        rPr = None
+        style_id = _resolve_style_id(part, style_names, WD_STYLE_TYPE.CHARACTER)
+        if style_id:
+            rPr = OxmlElement("w:rPr")
+            r_style = OxmlElement("w:rStyle")
+            r_style.set(qn("w:val"), style_id)
+            rPr.append(r_style)
+        cache[style_names] = rPr
+    return cache[style_names]
+
+
+def _append_run(p, text: str, style_names: tuple[str, ...] = ()) -> None:
+    r = OxmlElement("w:r")
+    if style_names:
+        rPr = _run_properties(p.part, style_names)
+        if rPr is not None:
+            r.append(copy.deepcopy(rPr))
+    r.text = text
+    p._p.append(r)
+
+
+def node_text(node, separator: str = "", strip: bool = False) -> str:
+    if not strip:
+        return node.text_content()
+    return separator.join(s.strip() for s in node.itertext() if s.strip())
+
+
+def first_text(node) -> str:
+    """第一个非空白文本片段（已 strip），遇到即停止遍历。"""
+    return next((s for s in (t.strip() for t in node.itertext()) if s), "")
+
+
+def iter_node_children(node):
+    """按文档顺序产出子节点：文本为 str，元素为 lxml 元素（跳过注释）。"""
+    if node.text:
+        yield node.text
+    for child in node:
+        if isinstance(child.tag, str):
+            yield child
+        if child.tail:
+            yield child.tail
+
+
+def _append_body_element(subdoc, el) -> None:
+    body = subdoc.element.body
+    sect_pr = body.sectPr
+    if sect_pr is not None:
+        sect_pr.addprevious(el)
+    else:
+        body.append(el)
 
 
 def update_fields_on_open(doc) -> None:
@@ -104,19 +229,15 @@ def update_fields_on_open(doc) -> None:
         settings.append(update_fields)
 
 
-def resolve_img_path(md_path: str, src: str) -> str:
+def resolve_img_path(base_dir: str, src: str) -> str:
     if os.path.isabs(src):
         return src
-    base_dir = os.path.dirname(os.path.abspath(md_path))
     return os.path.join(base_dir, src)
 
 
 def add_centered_image(subdoc, img_path: str, width_cm: float) -> None:
     p = subdoc.add_paragraph()
-    try:
-        p.style = "图片"
-    except KeyError:
-        p.style = "Normal"
+    apply_style(p, ("图片", "Normal"))
     p.paragraph_format.keep_with_next = True
     run = p.add_run()
     run.add_picture(img_path, width=Cm(width_cm))
@@ -126,7 +247,7 @@ def add_caption(subdoc, text: str) -> None:
     if not text:
         return
     p = subdoc.add_paragraph(text)
-    if not apply_style(p, ["图注", "Caption", "Normal"]):
+    if not apply_style(p, ("图注", "Caption", "Normal")):
         p.style = "Normal"
     fmt = p.paragraph_format
     fmt.keep_together = True
@@ -136,7 +257,7 @@ def add_heading(subdoc, text: str, style_name: str) -> None:
     if not text:
         return
     p = subdoc.add_paragraph(text)
-    if not apply_style(p, [style_name, "heading 1"]):
+    if not apply_style(p, (style_name, "heading 1")):
         p.style = "Heading 1"
     fmt = p.paragraph_format
     fmt.left_indent = None
@@ -148,62 +269,60 @@ def add_paragraph(subdoc, text: str, style_name: str) -> None:
     if not text:
         return
     p = subdoc.add_paragraph(text)
-    if not apply_style(p, [style_name, "Normal"]):
+    if not apply_style(p, (style_name, "Normal")):
         p.style = "Normal"
 
 
-def add_paragraph_with_inline_code(subdoc, p_node, style_name: str) -> None:
+def _is_inline_code(node) -> bool:
+    return getattr(node, "tag", None) == "code"
+
+
+def add_paragraph_with_inline_code(subdoc, children, style_name: str) -> None:
     p = subdoc.add_paragraph()
-    if not apply_style(p, [style_name, "Normal"]):
+    if not apply_style(p, (style_name, "Normal")):
         p.style = "Normal"
 
-    children = list(p_node.children)
-    pending_thinspace = False
-
-    for idx, child in enumerate(children):
-        if isinstance(child, NavigableString):
-            text = str(child)
-            if pending_thinspace and text.startswith(" "):
+    # 流式处理，只保留前一个与后一个节点：行内代码两侧紧邻的空格替换为细空格
+    prev = cur = None
+    for nxt in itertools.chain(children, (None,)):
+        if isinstance(cur, str):
+            text = cur
+            if _is_inline_code(prev) and text.startswith(" "):
                 text = "\u2009" + text[1:]
-                pending_thinspace = False
-            elif pending_thinspace:
-                pending_thinspace = False
             if text:
-                if idx + 1 < len(children) and getattr(children[idx + 1], "name", None) == "code":
-                    if text.endswith(" "):
-                        text = text[:-1] + "\u2009"
-                p.add_run(text)
-        elif hasattr(child, "name") and child.name == "code":
-            code_text = child.get_text()
+                if _is_inline_code(nxt) and text.endswith(" "):
+                    text = text[:-1] + "\u2009"
+                _append_run(p, text)
+        elif _is_inline_code(cur):
+            code_text = cur.text_content()
             if code_text:
-                run = p.add_run(code_text.replace(" ", "\u00A0"))
-                apply_style(run, ["行内代码", "Inline Code"])
-            if idx + 1 < len(children) and isinstance(children[idx + 1], NavigableString):
-                pending_thinspace = True
-        else:
-            text = child.get_text(strip=False) if hasattr(child, "get_text") else str(child)
-            if pending_thinspace and text.startswith(" "):
-                text = "\u2009" + text[1:]
-                pending_thinspace = False
-            elif pending_thinspace:
-                pending_thinspace = False
+                _append_run(p, code_text.replace(" ", "\u00A0"), ("行内代码", "Inline Code"))
+        elif cur is not None:
+            text = cur.text_content()
             if text:
-                p.add_run(text)
+                _append_run(p, text)
+        prev, cur = cur, nxt
 
 
 def add_list(subdoc, list_node, ordered: bool) -> None:
     style_name = "列表-有序" if ordered else "列表-无序"
-    for li in list_node.find_all("li", recursive=False):
-        li_copy = BeautifulSoup(li.encode_contents(), "html.parser")
-        for nested in li_copy.find_all(["ul", "ol"]):
-            nested.decompose()
-        if li_copy.get_text(strip=True) or li_copy.find("code"):
-            add_paragraph_with_inline_code(subdoc, li_copy, style_name)
-        for nested in li.find_all(["ul", "ol"], recursive=False):
-            add_list(subdoc, nested, ordered=nested.name == "ol")
-
-
-
+    for li in list_node.iterchildren("li"):
+        inline_children = [
+            c for c in iter_node_children(li) if isinstance(c, str) or c.tag not in ("ul", "ol")
+        ]
+        has_content = any(
+            c.strip() if isinstance(c, str)
+            else node_text(c, strip=True) or c.tag == "code" or c.find(".//code") is not None
+            for c in inline_children
+        )
+        if has_content:
+            add_paragraph_with_inline_code(subdoc, inline_children, style_name)
+        for nested in li.iterchildren("ul", "ol"):
+            add_list(subdoc, nested, ordered=nested.tag == "ol")
+
+
+
+@functools.lru_cache(maxsize=64)
 def format_language(lang: str) -> str:
     if not lang:
         return ""
@@ -225,46 +344,69 @@ def format_language(lang: str) -> str:
 
 
 def add_code_block(subdoc, pre_node) -> None:
-    code_node = pre_node.find("code")
+    code_node = pre_node.find(".//code")
     lang = None
+    if code_node is not None:
+        lang = next(
+            (c[len("language-"):] for c in code_node.get("class", "").split() if c.startswith("language-")),
+            None,
+        )
 
-    if code_node and code_node.has_attr("class"):
-        for cls in code_node["class"]:
-            if cls.startswith("language-"):
-                lang = cls.replace("language-", "").strip()
-                break
-
-    code_text = code_node.get_text() if code_node else pre_node.get_text()
-    code_text = code_text.replace("\r\n", "\n").replace("\r", "\n").rstrip("\n")
+    code_text = code_node.text_content() if code_node is not None else pre_node.text_content()
+    lines = _NEWLINE_RX.split(code_text)
+    while len(lines) > 1 and not lines[-1]:
+        lines.pop()
 
     if lang:
         p_lang = subdoc.add_paragraph(f"语言：{format_language(lang)}")
-        if not apply_style(p_lang, ["代码语言标记", "代码块"]):
+        if not apply_style(p_lang, ("代码语言标记", "代码块")):
             p_lang.style = "Normal"
 
-    for line in code_text.split("\n"):
-        p = subdoc.add_paragraph(line)
-        if not apply_style(p, ["代码块", "Normal"]):
-            p.style = "Normal"
+    # 每行一个段落，拼成一段 XML 一次解析后整体追加
+    style_id = _resolve_style_id(subdoc.part, ("代码块", "Normal"), WD_STYLE_TYPE.PARAGRAPH)
+    p_pr = f'<w:pPr><w:pStyle w:val="{_xml_attr(style_id)}"/></w:pPr>' if style_id else ""
+    xml = "".join(f"<w:p>{p_pr}{_run_xml(line)}</w:p>" for line in lines)
+    for p in list(parse_xml(f"<w:body {nsdecls('w')}>{xml}</w:body>")):
+        _append_body_element(subdoc, p)
+
+
+def _xml_attr(value: str) -> str:
+    return escape(value, {'"': "&quot;"})
+
+
+def _run_xml(text: str) -> str:
+    """纯文本 run 的 OOXML；制表符与换行分别映射为 w:tab / w:br。"""
+    if not text:
+        return ""
+    parts = []
+    for chunk in _RUN_BREAK_RX.split(text):
+        if chunk == "\t":
+            parts.append("<w:tab/>")
+        elif chunk in ("\r\n", "\n", "\r"):
+            parts.append("<w:br/>")
+        elif chunk:
+            space = ' xml:space="preserve"' if chunk != chunk.strip() else ""
+            parts.append(f"<w:t{space}>{escape(chunk)}</w:t>")
+    return f"<w:r>{''.join(parts)}</w:r>"
 
 
 def add_table(subdoc, table_node) -> None:
     rows = []
-    thead = table_node.find("thead")
-    if thead:
-        for tr in thead.find_all("tr", recursive=False):
-            cells = [cell.get_text(strip=True) for cell in tr.find_all(["th", "td"], recursive=False)]
+    thead = table_node.find(".//thead")
+    if thead is not None:
+        for tr in thead.iterchildren("tr"):
+            cells = [node_text(cell, strip=True) for cell in tr.iterchildren("th", "td")]
             if cells:
                 rows.append(("header", cells))
-    tbody = table_node.find("tbody")
-    if tbody:
-        for tr in tbody.find_all("tr", recursive=False):
-            cells = [cell.get_text(strip=True) for cell in tr.find_all(["th", "td"], recursive=False)]
+    tbody = table_node.find(".//tbody")
+    if tbody is not None:
+        for tr in tbody.iterchildren("tr"):
+            cells = [node_text(cell, strip=True) for cell in tr.iterchildren("th", "td")]
             if cells:
                 rows.append(("body", cells))
-    if not thead and not tbody:
-        for tr in table_node.find_all("tr", recursive=False):
-            cells = [cell.get_text(strip=True) for cell in tr.find_all(["th", "td"], recursive=False)]
+    if thead is None and tbody is None:
+        for tr in table_node.iterchildren("tr"):
+            cells = [node_text(cell, strip=True) for cell in tr.iterchildren("th", "td")]
             if cells:
                 rows.append(("body", cells))
     if not rows:
@@ -274,38 +416,153 @@ def add_table(subdoc, table_node) -> None:
     if max_cols == 0:
         return
 
-    table = subdoc.add_table(rows=len(rows), cols=max_cols)
-    if not apply_style(table, ["CyanScript Table", "Normal Table", "Table Grid"]):
-        table.style = "Normal Table"
+    # 与 python-docx 的 add_table 结构一致，但整张表只解析一次 XML
+    part = subdoc.part
+    section = subdoc.sections[-1]
+    block_width = section.page_width - section.left_margin - section.right_margin
+    col_twips = Emu(block_width // max_cols).twips
+    tbl_style = _resolve_style_id(
+        part, ("CyanScript Table", "Normal Table", "Table Grid"), WD_STYLE_TYPE.TABLE
+    )
+    cell_styles = {
+        "header": _resolve_style_id(part, ("表格-表头", "表格表头"), WD_STYLE_TYPE.PARAGRAPH),
+        "body": _resolve_style_id(part, ("表格-正文", "表格正文"), WD_STYLE_TYPE.PARAGRAPH),
+    }
 
-    for r_idx, (row_kind, cells) in enumerate(rows):
-        row = table.rows[r_idx]
+    xml = [f"<w:tbl {nsdecls('w')}><w:tblPr>"]
+    if tbl_style:
+        xml.append(f'<w:tblStyle w:val="{_xml_attr(tbl_style)}"/>')
+    xml.append(
+        '<w:tblW w:type="auto" w:w="0"/>'
+        '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0"'
+        ' w:noHBand="0" w:noVBand="1" w:val="04A0"/>'
+        "</w:tblPr><w:tblGrid>"
+    )
+    xml.append(f'<w:gridCol w:w="{col_twips}"/>' * max_cols)
+    xml.append("</w:tblGrid>")
+    for row_kind, cells in rows:
+        style_id = cell_styles[row_kind]
+        p_pr = f'<w:pPr><w:pStyle w:val="{_xml_attr(style_id)}"/></w:pPr>' if style_id else ""
+        xml.append("<w:tr>")
         for c_idx in range(max_cols):
-            cell = row.cells[c_idx]
             text = cells[c_idx] if c_idx < len(cells) else ""
-            cell.text = text
-            style_candidates = (
-                ["表格-表头", "表格表头"] if row_kind == "header" else ["表格-正文", "表格正文"]
+            xml.append(
+                f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{col_twips}"/></w:tcPr>'
+                f"<w:p>{p_pr}{_run_xml(text)}</w:p></w:tc>"
             )
-            for paragraph in cell.paragraphs:
-                apply_style(paragraph, style_candidates)
+        xml.append("</w:tr>")
+    xml.append("</w:tbl>")
+    _append_body_element(subdoc, parse_xml("".join(xml)))
+
+
+
+@functools.lru_cache(maxsize=None)
+def markdown_backend() -> str:
+    """CYANSCRIPT_MARKDOWN=markdown 强制使用 python-markdown；默认优先 markdown-it-py。"""
+    backend = os.getenv("CYANSCRIPT_MARKDOWN", "").strip().lower()
+    if backend == "markdown":
+        return "markdown"
+    if importlib.util.find_spec("markdown_it") is not None:
+        return "markdown-it"
+    if backend == "markdown-it":
+        print("[WARN] markdown-it-py not installed; falling back to markdown.")
+    return "markdown"
+
 
+def render_markdown_html(md_text: str, backend: str) -> str:
+    if backend == "markdown-it":
+        from markdown_it import MarkdownIt
+
+        md = MarkdownIt("commonmark", {"html": True}).enable(["table", "strikethrough"])
+        return md.render(md_text)
+
+    from markdown import markdown
+
+    return markdown(md_text, extensions=["extra"])
+
+
+@functools.lru_cache(maxsize=None)
+def _converter_digest(backend: str) -> str:
+    """脚本内容 + 解析库版本的摘要；改了转换逻辑或升级了库，旧的 HTML 缓存即失效。"""
+    h = hashlib.sha1()
+    with open(os.path.abspath(__file__), "rb") as f:
+        h.update(f.read())
+    dist = "markdown-it-py" if backend == "markdown-it" else "Markdown"
+    try:
+        h.update(importlib.metadata.version(dist).encode("utf-8"))
+    except importlib.metadata.PackageNotFoundError:
+        pass
+    return h.hexdigest()[:16]
 
 
-def render_markdown_to_subdoc(subdoc, md_path: str) -> None:
+def _atomic_write(path: str, data: bytes) -> None:
+    """先写同目录临时文件再 os.replace，中断或并发运行时不会留下半截缓存。"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def markdown_to_html(md_path: str, md_bytes: bytes) -> str:
+    backend = markdown_backend()
+    abs_path = os.path.abspath(md_path)
+    st = os.stat(abs_path)
+    key = (abs_path, backend, st.st_mtime_ns, st.st_size)
+    html = _MD_CACHE.get(key)
+    if html is not None:
+        return html
+
+    cache_dir = os.path.join(_CACHE_DIR, "md")
+    prefix = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()
+    converter = _converter_digest(backend)
+    cache_path = os.path.join(
+        cache_dir, f"{prefix}-{backend}-{converter}-{st.st_mtime_ns}-{st.st_size}.html"
+    )
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            html = f.read()
+    except (OSError, ValueError):
+        html = render_markdown_html(md_bytes.decode("utf-8"), backend)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # 同一文件只保留最新一份
+            for name in os.listdir(cache_dir):
+                if name.startswith(f"{prefix}-"):
+                    os.remove(os.path.join(cache_dir, name))
+            _atomic_write(cache_path, html.encode("utf-8"))
+        except OSError:
+            print(f"[WARN] Failed to write cache: {cache_path}")
+
+    _MD_CACHE[key] = html
+    return html
+
+
+def render_markdown_to_subdoc(subdoc, md_path: str, md_bytes: Optional[bytes] = None) -> list[str]:
     if not os.path.exists(md_path):
         print(f"[ERROR] Markdown not found: {md_path}")
         sys.exit(1)
 
-    with open(md_path, "r", encoding="utf-8") as f:
-        md_text = f.read()
+    if md_bytes is None:
+        with open(md_path, "rb") as f:
+            md_bytes = f.read()
+
+    import lxml.html
 
-    html = markdown(md_text, extensions=["extra"])
-    soup = BeautifulSoup(html, "html.parser")
-    body = soup.body if soup.body else soup
+    html = markdown_to_html(md_path, md_bytes)
+    body = lxml.html.fragment_fromstring(html, create_parent="body")
 
+    base_dir = os.path.dirname(os.path.abspath(md_path))
     fig_index = 0
     pending_table_caption = ""
+    # 同一图片可能被多处引用，存在性只检查一次；键同时作为返回的图片路径列表
+    img_exists: dict[str, bool] = {}
 
     def handle_image(src: str, caption: str) -> None:
         nonlocal fig_index
@@ -317,74 +574,163 @@ def render_markdown_to_subdoc(subdoc, md_path: str) -> None:
             name = os.path.splitext(base)[0]
         fig_index += 1
         caption_text = f"图{fig_index} {name}" if name else f"图{fig_index}"
-        img_path = resolve_img_path(md_path, src)
-        if os.path.exists(img_path):
+        img_path = resolve_img_path(base_dir, src)
+        exists = img_exists.get(img_path)
+        if exists is None:
+            exists = img_exists[img_path] = os.path.exists(img_path)
+        if exists:
             add_centered_image(subdoc, img_path, 15)
             add_caption(subdoc, caption_text)
         else:
             add_paragraph(subdoc, f"[图片缺失: {src}]", "Normal")
             add_caption(subdoc, caption_text)
 
-    for node in body.children:
-        if not hasattr(node, "name"):
+    def handle_paragraph(node) -> None:
+        nonlocal pending_table_caption
+        first = first_text(node)
+        if first:
+            # 只有以“表”开头时才需要拼出整段文本判断是否为表注
+            caption = node_text(node, strip=True) if first.startswith("表") else ""
+            if caption and _TABLE_CAPTION_RX.match(caption):
+                pending_table_caption = caption
+            else:
+                add_paragraph_with_inline_code(subdoc, iter_node_children(node), "Normal")
+        for img in node.iterfind(".//img"):
+            handle_image(img.get("src", ""), img.get("alt", "") or "")
+        for link in node.iterfind(".//a"):
+            href = link.get("href", "")
+            if _IMG_EXT_RX.search(href):
+                handle_image(href, node_text(link, strip=True))
+
+    def handle_blockquote(node) -> None:
+        quote_text = node_text(node, "\n", strip=True)
+        if quote_text:
+            for line in quote_text.split("\n"):
+                stripped = line.strip()
+                if stripped.startswith("提示:") or stripped.startswith("提示："):
+                    add_paragraph(subdoc, line, "提示块")
+                elif stripped.startswith("注意:") or stripped.startswith("注意："):
+                    add_paragraph(subdoc, line, "注意块")
+                elif stripped.startswith("警告:") or stripped.startswith("警告："):
+                    add_paragraph(subdoc, line, "警告块")
+                else:
+                    add_paragraph(subdoc, line, "引用块")
+
+    def handle_table(node) -> None:
+        nonlocal pending_table_caption
+        if pending_table_caption:
+            p = subdoc.add_paragraph(pending_table_caption)
+            if not apply_style(p, ("表注", "Caption", "Normal")):
+                print("[WARN] Table caption style not found; using Normal.")
+            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            pending_table_caption = ""
+        add_table(subdoc, node)
+
+    def handle_link(node) -> None:
+        href = node.get("href", "")
+        if _IMG_EXT_RX.search(href):
+            handle_image(href, node_text(node, strip=True))
+        else:
+            add_paragraph(subdoc, node_text(node, strip=True), "Normal")
+
+    handlers = {
+        "p": handle_paragraph,
+        "blockquote": handle_blockquote,
+        "img": lambda node: handle_image(node.get("src", ""), node.get("alt", "") or ""),
+        "table": handle_table,
+        "ul": lambda node: add_list(subdoc, node, ordered=False),
+        "ol": lambda node: add_list(subdoc, node, ordered=True),
+        "pre": lambda node: add_code_block(subdoc, node),
+        "a": handle_link,
+    }
+
+    for node in body:
+        # 注释节点的 tag 不是字符串，两张表都查不到，自然跳过
+        heading_style = _HEADING_STYLE.get(node.tag)
+        if heading_style:
+            add_heading(subdoc, strip_heading_number(node_text(node, strip=True)), heading_style)
             continue
+        handler = handlers.get(node.tag)
+        if handler:
+            handler(node)
 
-        if node.name == "h1":
-            add_heading(subdoc, strip_heading_number(node.get_text(strip=True)), "heading 1")
-        elif node.name == "h2":
-            add_heading(subdoc, strip_heading_number(node.get_text(strip=True)), "heading 2")
-        elif node.name == "h3":
-            add_heading(subdoc, strip_heading_number(node.get_text(strip=True)), "heading 3")
-        elif node.name == "h4":
-            add_heading(subdoc, strip_heading_number(node.get_text(strip=True)), "heading 4")
-        elif node.name == "p":
-            text = node.get_text(strip=True)
-            if text:
-                if re.match(r"^表\s*\d+\s+.+", text):
-                    pending_table_caption = text
-                else:
-                    add_paragraph_with_inline_code(subdoc, node, "Normal")
-            for img in node.find_all("img"):
-                handle_image(img.get("src", ""), img.get("alt", "") or "")
-            for link in node.find_all("a"):
-                href = link.get("href", "")
-                if href.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp")):
-                    handle_image(href, link.get_text(strip=True))
-        elif node.name == "blockquote":
-            quote_text = node.get_text("\n", strip=True)
-            if quote_text:
-                for line in quote_text.split("\n"):
-                    stripped = line.strip()
-                    if stripped.startswith("提示:") or stripped.startswith("提示："):
-                        add_paragraph(subdoc, line, "提示块")
-                    elif stripped.startswith("注意:") or stripped.startswith("注意："):
-                        add_paragraph(subdoc, line, "注意块")
-                    elif stripped.startswith("警告:") or stripped.startswith("警告："):
-                        add_paragraph(subdoc, line, "警告块")
-                    else:
-                        add_paragraph(subdoc, line, "引用块")
-        elif node.name == "img":
-            handle_image(node.get("src", ""), node.get("alt", "") or "")
-        elif node.name == "table":
-            if pending_table_caption:
-                p = subdoc.add_paragraph(pending_table_caption)
-                if not apply_style(p, ["表注", "Caption", "Normal"]):
-                    print("[WARN] Table caption style not found; using Normal.")
-                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                pending_table_caption = ""
-            add_table(subdoc, node)
-        elif node.name == "ul":
-            add_list(subdoc, node, ordered=False)
-        elif node.name == "ol":
-            add_list(subdoc, node, ordered=True)
-        elif node.name == "pre":
-            add_code_block(subdoc, node)
-        elif node.name == "a":
-            href = node.get("href", "")
-            if href.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp")):
-                handle_image(href, node.get_text(strip=True))
-            else:
-                add_paragraph(subdoc, node.get_text(strip=True), "Normal")
+    return list(img_exists)
+
+
+def subdoc_cache_path(md_path: str, md_bytes: bytes, template_path: str) -> str:
+    abs_path = os.path.abspath(md_path)
+    h = hashlib.sha256()
+    h.update(abs_path.encode("utf-8"))
+    h.update(md_bytes)
+    # 解析器不同，输出也不同（CYANSCRIPT_MARKDOWN / markdown-it-py 是否安装）
+    h.update(markdown_backend().encode("utf-8"))
+    for path in (template_path, os.path.abspath(__file__)):
+        with open(path, "rb") as f:
+            h.update(f.read())
+    # 文件名前缀标识 Markdown 路径，写入新缓存时据此清理同一文件的旧缓存
+    prefix = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()
+    return os.path.join(_CACHE_DIR, f"{prefix}-{h.hexdigest()}.pkl")
+
+
+def _file_mtime(path: str):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def load_cached_subdoc(subdoc, cache_path: str) -> bool:
+    # 缓存损坏（截断、格式不对、XML 解析失败等）一律视为未命中，回退到重新渲染；
+    # 先全部解析成功再写入 subdoc，避免半截内容与回退渲染的结果叠在一起
+    try:
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+        images = cached["images"]
+        # 图片文件在两次运行之间被修改/删除时，缓存失效
+        if any(_file_mtime(img_path) != mtime for img_path, mtime in images.values()):
+            return False
+        parsed = [parse_xml(xml) for xml in cached["elements"]]
+    except Exception:
+        return False
+
+    rid_map = {}
+    for old_rid, (img_path, mtime) in images.items():
+        if mtime is not None:
+            rid_map[old_rid], _ = subdoc.part.get_or_add_image(img_path)
+
+    for el in parsed:
+        for blip in el.iter(qn("a:blip")):
+            old_rid = blip.get(qn("r:embed"))
+            if old_rid in rid_map:
+                blip.set(qn("r:embed"), rid_map[old_rid])
+        _append_body_element(subdoc, el)
+    return True
+
+
+def save_cached_subdoc(subdoc, cache_path: str, img_paths: list[str]) -> None:
+    images = {}
+    for img_path in img_paths:
+        mtime = _file_mtime(img_path)
+        if mtime is None:
+            images[f"missing:{img_path}"] = (img_path, None)
+            continue
+        rid, _ = subdoc.part.get_or_add_image(img_path)
+        images[rid] = (img_path, mtime)
+
+    body = subdoc.element.body
+    elements = [etree.tostring(el) for el in body if el is not body.sectPr]
+    cache_dir, cache_name = os.path.split(cache_path)
+    prefix = cache_name.split("-", 1)[0]
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # 同一文件只保留最新一份
+        for name in os.listdir(cache_dir):
+            if name.startswith(f"{prefix}-") and name.endswith(".pkl"):
+                os.remove(os.path.join(cache_dir, name))
+        data = pickle.dumps({"elements": elements, "images": images}, protocol=pickle.HIGHEST_PROTOCOL)
+        _atomic_write(cache_path, data)
+    except OSError:
+        print(f"[WARN] Failed to write cache: {cache_path}")
 
 
 def prompt_input(label: str) -> str:
@@ -392,7 +738,7 @@ def prompt_input(label: str) -> str:
 
 
 def safe_filename(value: str) -> str:
-    cleaned = value.replace("\\", "_").replace("/", "_").strip()
+    cleaned = value.translate(_SAFE_FILENAME_TABLE).strip()
     return cleaned or "output"
 
 
@@ -447,9 +793,22 @@ def main() -> None:
     version = prompt_input("[INPUT] Version: ")
     md_path = prompt_input("[INPUT] Markdown file: ")
 
+    # docxtpl 依赖较重，放到确认模板存在之后再导入
+    from docxtpl import DocxTemplate
+
     tpl = DocxTemplate(template_path)
     subdoc = tpl.new_subdoc()
-    render_markdown_to_subdoc(subdoc, md_path)
+    if not os.path.exists(md_path):
+        print(f"[ERROR] Markdown not found: {md_path}")
+        sys.exit(1)
+    with open(md_path, "rb") as f:
+        md_bytes = f.read()
+    cache_path = subdoc_cache_path(md_path, md_bytes, template_path)
+    if load_cached_subdoc(subdoc, cache_path):
+        print(f"[OK] Reused cached content: {cache_path}")
+    else:
+        img_paths = render_markdown_to_subdoc(subdoc, md_path, md_bytes)
+        save_cached_subdoc(subdoc, cache_path, img_paths)
 
     context = {
         "software_name": software_name,
@@ -0,0 +1,68 @@
+"""fix_*.py 共用的 docx（ZIP）流式重写工具。"""
+import copy
+import os
+import shutil
+import zipfile
+from typing import IO, Callable, Union
+
+from lxml import etree
+
+DEFLATE_LEVEL = 6
+
+
+def output_zipinfo(info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    """输出条目信息：原本 STORED 的（图片、字体等）保持不压缩，其余统一用 Deflate。
+
+    条目都以显式 ZipInfo 写入，ZipFile 的 compression/compresslevel 参数不会作用于它们，
+    压缩级别只能设在 ZipInfo 上（Python 3.13 起属性名为 compress_level）。
+    """
+    out = copy.copy(info)
+    if out.compress_type != zipfile.ZIP_STORED:
+        out.compress_type = zipfile.ZIP_DEFLATED
+        if hasattr(out, "compress_level"):
+            out.compress_level = DEFLATE_LEVEL
+        else:
+            out._compresslevel = DEFLATE_LEVEL
+    return out
+
+
+def copy_zip_entry(zin: zipfile.ZipFile, zout: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    """流式复制一个条目，不整体读入内存。"""
+    with zin.open(info) as src, zout.open(output_zipinfo(info), "w") as dst:
+        shutil.copyfileobj(src, dst)
+
+
+def rewrite_docx_parts(
+    docx_in: str,
+    docx_out: str,
+    predicate: Callable[[str], bool],
+    fn: Callable[[IO[bytes]], Union[etree._ElementTree, bytes]],
+) -> None:
+    """按条目顺序重写 docx：predicate(name) 选中的部件交给 fn(src) 处理，其余条目流式复制。
+
+    fn 接收该部件的解压流；返回 lxml ElementTree 时直接序列化进压缩流（不在内存里拼出整份 XML），
+    返回 bytes 时原样写回。先写临时文件再替换，输入输出为同一路径时也安全。
+    """
+    tmp_out = f"{docx_out}.tmp"
+    try:
+        with zipfile.ZipFile(docx_in, "r") as zin, zipfile.ZipFile(tmp_out, "w") as zout:
+            for info in zin.infolist():
+                if not predicate(info.filename):
+                    copy_zip_entry(zin, zout, info)
+                    continue
+
+                with zin.open(info) as src:
+                    result = fn(src)
+                if isinstance(result, bytes):
+                    zout.writestr(output_zipinfo(info), result)
+                else:
+                    with zout.open(output_zipinfo(info), "w") as dst:
+                        result.write(dst, xml_declaration=True, encoding="UTF-8", standalone=True)
+        os.replace(tmp_out, docx_out)
+    except BaseException:
+        # 出错或中断（含 Ctrl-C）时不留下半截的临时文件
+        try:
+            os.remove(tmp_out)
+        except OSError:
+            pass
+        raise
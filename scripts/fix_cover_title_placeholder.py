@@ -1,68 +1,84 @@
 #!/usr/bin/env python3
-import zipfile
+from bisect import bisect_right
+from itertools import accumulate
 from lxml import etree
 
+from docx_zip import rewrite_docx_parts
+
 W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
 NS = {"w": W_NS}
 
+_T_TAG = f"{{{W_NS}}}t"
+_XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+# 预编译 XPath，避免每个 run 都重新解析表达式
+_XP_P = etree.XPath(".//w:p", namespaces=NS)
+_XP_R = etree.XPath(".//w:r", namespaces=NS)
+_XP_T = etree.XPath(".//w:t", namespaces=NS)
+
 
 def get_run_text(r):
-    ts = r.xpath(".//w:t", namespaces=NS)
+    ts = _XP_T(r)
     return "".join(t.text or "" for t in ts)
 
 
 def set_run_text(r, text):
-    ts = r.xpath(".//w:t", namespaces=NS)
+    ts = _XP_T(r)
     if not ts:
-        t = etree.Element(f"{{{W_NS}}}t")
-        t.text = text
+        if not text:
+            return
+        t = etree.Element(_T_TAG)
         r.append(t)
-        return
-    ts[0].text = text
-    for t in ts[1:]:
-        t.getparent().remove(t)
+    else:
+        t = ts[0]
+    if text.startswith(" ") or text.endswith(" "):
+        t.set(_XML_SPACE, "preserve")
+    t.text = text
+    for extra in ts[1:]:
+        extra.getparent().remove(extra)
+
+
+def run_text_and_map(p):
+    """返回段落文本、每个 run 文本的结束偏移（累加），以及 runs。"""
+    runs = _XP_R(p)
+    texts = [get_run_text(r) for r in runs]
+    return "".join(texts), list(accumulate(map(len, texts))), runs
 
 
 def merge_placeholder_runs_in_paragraph(p, placeholder: str) -> int:
-    runs = p.xpath(".//w:r", namespaces=NS)
+    full_text, run_ends, runs = run_text_and_map(p)
     changed = 0
-    i = 0
-    while i < len(runs):
-        acc = ""
-        end = None
-        for j in range(i, min(i + 12, len(runs))):
-            acc += get_run_text(runs[j])
-            if placeholder in acc:
-                if not acc.startswith(placeholder) or acc != placeholder:
-                    break
-                end = j
-                set_run_text(runs[i], placeholder)
-                for k in range(i + 1, end + 1):
-                    set_run_text(runs[k], "")
-                changed += 1
-                i = end
-                break
-        i += 1
+    consumed = 0  # 已被前一次合并挪走的文本终点
+    pos = full_text.find(placeholder)
+    while pos != -1:
+        end = pos + len(placeholder)
+        rs = bisect_right(run_ends, pos)
+        re_ = bisect_right(run_ends, end - 1)
+        if rs != re_:
+            # 占位符整体放进起始 run（保留其前面的文字），结束 run 只留占位符之后的文字
+            rs_start = max(run_ends[rs - 1] if rs else 0, consumed)
+            set_run_text(runs[rs], full_text[rs_start:end])
+            for k in range(rs + 1, re_):
+                set_run_text(runs[k], "")
+            set_run_text(runs[re_], full_text[end:run_ends[re_]])
+            consumed = end
+            changed += 1
+        pos = full_text.find(placeholder, end)
     return changed
 
 
 def fix_cover_title_placeholder(docx_in: str, docx_out: str) -> None:
     placeholder = "{{software_name}}"
-    with zipfile.ZipFile(docx_in, "r") as zin:
-        files = {n: zin.read(n) for n in zin.namelist()}
-
-    part = "word/document.xml"
-    root = etree.fromstring(files[part])
-
     changed = 0
-    for p in root.xpath(".//w:p", namespaces=NS):
-        changed += merge_placeholder_runs_in_paragraph(p, placeholder)
 
-    files[part] = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone="yes")
+    def fix_document(src):
+        nonlocal changed
+        tree = etree.parse(src)
+        for p in _XP_P(tree.getroot()):
+            changed += merge_placeholder_runs_in_paragraph(p, placeholder)
+        return tree
 
-    with zipfile.ZipFile(docx_out, "w") as zout:
-        for name, data in files.items():
-            zout.writestr(name, data)
+    rewrite_docx_parts(docx_in, docx_out, lambda name: name == "word/document.xml", fix_document)
 
     print(f"[OK] merged cover title placeholder runs: {changed}")
     print(f"[OK] wrote: {docx_out}")
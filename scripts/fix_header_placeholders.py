@@ -1,21 +1,36 @@
 #!/usr/bin/env python3
 import re
-import zipfile
+from bisect import bisect_right
+from itertools import accumulate
 from lxml import etree
 
+from docx_zip import rewrite_docx_parts
+
 W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
 NS = {"w": W_NS}
 
 # 支持 {{ }} / {% %} / {# #}
 PH_RE = re.compile(r"({{.*?}}|{%.+?%}|{#.+?#})", re.DOTALL)
 
-SIMPLE_ALLOWED = {
-    f"{{{W_NS}}}rPr",
-    f"{{{W_NS}}}t",
-    f"{{{W_NS}}}tab",
-    f"{{{W_NS}}}br",
-    f"{{{W_NS}}}cr",
-}
+_RPR_TAG = f"{{{W_NS}}}rPr"
+_T_TAG = f"{{{W_NS}}}t"
+_TAB_TAG = f"{{{W_NS}}}tab"
+_BR_TAG = f"{{{W_NS}}}br"
+_CR_TAG = f"{{{W_NS}}}cr"
+_XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+# run 里承载可见文本的子元素
+_TEXTISH_TAGS = frozenset((_T_TAG, _TAB_TAG, _BR_TAG, _CR_TAG))
+
+SIMPLE_ALLOWED = frozenset((_RPR_TAG,)) | _TEXTISH_TAGS
+
+# 预编译 XPath，避免每个 run 都重新解析表达式
+_XP_P = etree.XPath(".//w:p", namespaces=NS)
+_XP_R = etree.XPath("./w:r", namespaces=NS)
+_XP_T = etree.XPath("./w:t", namespaces=NS)
+_XP_TAB = etree.XPath("./w:tab", namespaces=NS)
+_XP_BR = etree.XPath("./w:br", namespaces=NS)
+_XP_CR = etree.XPath("./w:cr", namespaces=NS)
 
 
 def is_simple_run(r: etree._Element) -> bool:
@@ -26,87 +41,66 @@ def is_simple_run(r: etree._Element) -> bool:
     return True
 
 
-def run_text_and_map(p: etree._Element):
-    """返回 paragraph 的可见文本，以及每个字符属于哪个 run index。"""
-    runs = p.findall("./w:r", namespaces=NS)
-    full = []
-    char_to_run = []
-
-    for i, r in enumerate(runs):
-        for t in r.findall("./w:t", namespaces=NS):
-            s = t.text or ""
-            for ch in s:
-                full.append(ch)
-                char_to_run.append(i)
+def run_text_and_map(runs):
+    """返回这些 run 拼起来的可见文本，以及每个 run 文本的结束偏移（累加）。
 
-        if r.find("./w:tab", namespaces=NS) is not None:
-            full.append("\t")
-            char_to_run.append(i)
-        if r.find("./w:br", namespaces=NS) is not None:
-            full.append("\n")
-            char_to_run.append(i)
-        if r.find("./w:cr", namespaces=NS) is not None:
-            full.append("\n")
-            char_to_run.append(i)
-
-    return "".join(full), char_to_run, runs
+    字符偏移 i 所属的 run index 为 bisect_right(run_ends, i)。
+    """
+    texts = [
+        "".join((t.text or "") for t in _XP_T(r))
+        + ("\t" if _XP_TAB(r) else "")
+        + ("\n" if _XP_BR(r) else "")
+        + ("\n" if _XP_CR(r) else "")
+        for r in runs
+    ]
+    return "".join(texts), list(accumulate(map(len, texts)))
 
 
 def clear_text_children(r: etree._Element):
     """清掉 run 里的 t/tab/br/cr，保留 rPr。"""
     for child in list(r):
-        if child.tag in {f"{{{W_NS}}}t", f"{{{W_NS}}}tab", f"{{{W_NS}}}br", f"{{{W_NS}}}cr"}:
+        if child.tag in _TEXTISH_TAGS:
             r.remove(child)
 
 
 def set_run_text(r: etree._Element, text: str):
     clear_text_children(r)
-    t = etree.SubElement(r, f"{{{W_NS}}}t")
+    t = etree.SubElement(r, _T_TAG)
     if text.startswith(" ") or text.endswith(" "):
-        t.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+        t.set(_XML_SPACE, "preserve")
     t.text = text
 
 
 def merge_placeholders_in_paragraph(p: etree._Element) -> int:
     """合并一个段落里跨 run 的占位符。返回合并次数。"""
-    merges = 0
-
-    while True:
-        full_text, char_to_run, runs = run_text_and_map(p)
-        if not full_text:
-            break
-
-        m = PH_RE.search(full_text)
-        if not m:
-            break
+    runs = _XP_R(p)
+    # 只有一个 run 的段落不可能有跨 run 的占位符
+    if len(runs) <= 1:
+        return 0
+
+    full_text, run_ends = run_text_and_map(runs)
+    if not full_text:
+        return 0
+
+    # 一次扫描收集所有跨 run 的占位符；共用 run 的相邻区间合并成一段
+    spans = []
+    for m in PH_RE.finditer(full_text):
+        rs = bisect_right(run_ends, m.start())
+        re_ = bisect_right(run_ends, m.end() - 1)
+        if rs == re_:
+            continue
+        if spans and rs <= spans[-1][1]:
+            spans[-1][1] = max(spans[-1][1], re_)
+        else:
+            spans.append([rs, re_])
 
-        s, e = m.span()
-        if s >= len(char_to_run) or e - 1 >= len(char_to_run):
-            break
+    # 从右往左合并，前面区间的 run 下标不受影响
+    merges = 0
+    for rs, re_ in reversed(spans):
+        if not all(is_simple_run(runs[j]) for j in range(rs, re_ + 1)):
+            continue
 
-        rs = char_to_run[s]
-        re_ = char_to_run[e - 1]
-        if rs == re_:
-            full_text = full_text[:s] + (" " * (e - s)) + full_text[e:]
-            m2 = PH_RE.search(full_text)
-            if not m2:
-                break
-            s, e = m2.span()
-            rs = char_to_run[s]
-            re_ = char_to_run[e - 1]
-            if rs == re_:
-                break
-
-        if any((j >= len(runs)) or (not is_simple_run(runs[j])) for j in range(rs, re_ + 1)):
-            break
-
-        merged_text = "".join(
-            "".join((t.text or "") for t in runs[j].findall("./w:t", namespaces=NS))
-            + ("\t" if runs[j].find("./w:tab", namespaces=NS) is not None else "")
-            + ("\n" if runs[j].find("./w:br", namespaces=NS) is not None else "")
-            + ("\n" if runs[j].find("./w:cr", namespaces=NS) is not None else "")
-            for j in range(rs, re_ + 1)
-        )
+        merged_text = full_text[run_ends[rs - 1] if rs else 0:run_ends[re_]]
 
         set_run_text(runs[rs], merged_text)
 
@@ -119,24 +113,22 @@ def merge_placeholders_in_paragraph(p: etree._Element) -> int:
 
 
 def fix_header_placeholders(input_docx: str, output_docx: str) -> None:
-    with zipfile.ZipFile(input_docx, "r") as zin:
-        files = {n: zin.read(n) for n in zin.namelist()}
-
-    target_parts = [
-        n for n in files.keys()
-        if n.startswith("word/header") or n.startswith("word/footer")
-    ]
-
     total_merges = 0
-    for part in target_parts:
-        root = etree.fromstring(files[part])
-        for p in root.findall(".//w:p", namespaces=NS):
+
+    def fix_part(src):
+        nonlocal total_merges
+        data = src.read()
+        # 占位符可能恰好从两个 "{" 之间断开，所以只能用单个 "{" 预判；没有就原样写回，省去解析
+        if b"{" not in data:
+            return data
+        root = etree.fromstring(data)
+        for p in _XP_P(root):
             total_merges += merge_placeholders_in_paragraph(p)
-        files[part] = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone="yes")
+        return etree.ElementTree(root)
 
-    with zipfile.ZipFile(output_docx, "w") as zout:
-        for name, data in files.items():
-            zout.writestr(name, data)
+    rewrite_docx_parts(
+        input_docx, output_docx, lambda name: name.startswith(("word/header", "word/footer")), fix_part
+    )
 
     print(f"[OK] merged placeholder runs in header/footer: {total_merges}")
     print(f"[OK] wrote: {output_docx}")
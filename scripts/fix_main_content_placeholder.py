@@ -1,28 +1,32 @@
 #!/usr/bin/env python3
-import zipfile
+import copy
 from lxml import etree
 
+from docx_zip import rewrite_docx_parts
+
 W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
 NS = {"w": W_NS}
 
+_R_TAG = f"{{{W_NS}}}r"
+_T_TAG = f"{{{W_NS}}}t"
 
-def paragraph_text(p):
-    return "".join(t.text or "" for t in p.findall(".//w:t", namespaces=NS))
+# 预编译 XPath，避免每个段落都重新解析表达式
+_XP_P = etree.XPath(".//w:p", namespaces=NS)
+_XP_PPR = etree.XPath("./w:pPr", namespaces=NS)
 
 
-def fix_main_content_placeholder(docx_in: str, docx_out: str) -> None:
-    with zipfile.ZipFile(docx_in, "r") as zin:
-        files = {n: zin.read(n) for n in zin.namelist()}
+def paragraph_text(p):
+    return "".join(t.text or "" for t in p.iter(_T_TAG))
 
-    part = "word/document.xml"
-    root = etree.fromstring(files[part])
 
+def rebuild_main_content_paragraph(root) -> int:
     fixed = 0
-    for p in root.findall(".//w:p", namespaces=NS):
+    for p in _XP_P(root):
         txt = paragraph_text(p)
         if "main_content" in txt:
-            pPr = p.find("./w:pPr", namespaces=NS)
-            pPr_copy = etree.fromstring(etree.tostring(pPr)) if pPr is not None else None
+            pPrs = _XP_PPR(p)
+            pPr = pPrs[0] if pPrs else None
+            pPr_copy = copy.deepcopy(pPr) if pPr is not None else None
 
             for child in list(p):
                 p.remove(child)
@@ -30,18 +34,25 @@ def fix_main_content_placeholder(docx_in: str, docx_out: str) -> None:
             if pPr_copy is not None:
                 p.append(pPr_copy)
 
-            r = etree.SubElement(p, f"{{{W_NS}}}r")
-            t = etree.SubElement(r, f"{{{W_NS}}}t")
+            r = etree.SubElement(p, _R_TAG)
+            t = etree.SubElement(r, _T_TAG)
             t.text = "{{main_content}}"
 
             fixed += 1
             break
+    return fixed
+
+
+def fix_main_content_placeholder(docx_in: str, docx_out: str) -> None:
+    fixed = 0
 
-    files[part] = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone="yes")
+    def fix_document(src):
+        nonlocal fixed
+        tree = etree.parse(src)
+        fixed += rebuild_main_content_paragraph(tree.getroot())
+        return tree
 
-    with zipfile.ZipFile(docx_out, "w") as zout:
-        for name, data in files.items():
-            zout.writestr(name, data)
+    rewrite_docx_parts(docx_in, docx_out, lambda name: name == "word/document.xml", fix_document)
 
     print(f"[OK] forced rebuilt main_content paragraph: {fixed}")
     print(f"[OK] wrote: {docx_out}")
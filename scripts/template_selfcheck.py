@@ -25,19 +25,33 @@ Exit codes:
   1: fatal error
 """
 import argparse
+import os
 import re
 import sys
 import zipfile
-import xml.etree.ElementTree as ET
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate, islice
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional, Iterable
 
+from lxml import etree as ET
+
 NS = {"w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"}
 REL_NS = {"r": "http://schemas.openxmlformats.org/package/2006/relationships"}
+# Relationship elements are always direct children of <Relationships>.
+RELATIONSHIP_TAG = f"{{{REL_NS['r']}}}Relationship"
 
 PLACEHOLDER_RE = re.compile(r"({{.*?}}|{%.*?%}|{#.*?#})", flags=re.DOTALL)
+# Cheap single-pass guard: no opening delimiter means no placeholder can match.
+PLACEHOLDER_PREFILTER_RE = re.compile(r"\{[{%#]")
 
 EXTERNAL_FIELD_KEYWORDS = ("INCLUDETEXT", "INCLUDEPICTURE", "LINK", "DDEAUTO", "DDE")
+# Whole-word match, so e.g. HYPERLINK is not mistaken for a LINK field.
+EXTERNAL_FIELD_RE = re.compile(r"\b(?:%s)\b" % "|".join(EXTERNAL_FIELD_KEYWORDS), flags=re.IGNORECASE)
+
+EMBEDDED_PART_PREFIXES = ("word/embeddings/", "word/activeX/")
 
 RUN_SPECIAL_TEXT = {
     "tab": "\t",
@@ -47,91 +61,142 @@ RUN_SPECIAL_TEXT = {
     "softHyphen": "\u00ad",
 }
 
+W_T_TAG = f"{{{NS['w']}}}t"
+W_R_TAG = f"{{{NS['w']}}}r"
+W_P_TAG = f"{{{NS['w']}}}p"
+W_INSTR_TEXT_TAG = f"{{{NS['w']}}}instrText"
+RUN_SPECIAL_TEXT_BY_TAG = {f"{{{NS['w']}}}{local}": text for local, text in RUN_SPECIAL_TEXT.items()}
+
 DEFAULT_BODY_STYLE_NAMES = {"正文", "Normal"}
 
+# Containers where a body-style paragraph is considered misplaced.
+BODY_STYLE_BAD_CONTAINER_TAGS = frozenset(f"{{{NS['w']}}}{local}" for local in ("hdr", "ftr", "tbl", "txbxContent"))
+
+
+# Evaluated in C over the paragraph's whole string value: paragraphs without any "{"
+# cannot contain a placeholder, so run texts are never built for them.
+PARAGRAPH_HAS_BRACE = ET.XPath("contains(., '{')")
+# Paragraph styleId, or "" when the paragraph has none.
+PARAGRAPH_STYLE_ID = ET.XPath("string(w:pPr/w:pStyle/@w:val)", namespaces=NS)
+
+
+# Parts whose uncompressed size exceeds this are streamed with iterparse instead of
+# being loaded as a whole tree, keeping peak memory near one top-level paragraph.
+STREAM_PART_MIN_SIZE = 8 * 1024 * 1024
+
+# Parts parsed ahead of the checker; bounds how many whole trees are alive at once.
+PARSE_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def xml_parser() -> ET.XMLParser:
+    # One parser per call: parts are parsed concurrently and lxml parsers must not be shared across threads.
+    return ET.XMLParser(huge_tree=True, remove_blank_text=False)
 
-def read_xml(zf: zipfile.ZipFile, name: str) -> Optional[ET.Element]:
+
+def read_xml(zf: zipfile.ZipFile, name: str) -> Optional[ET._Element]:
     try:
         data = zf.read(name)
     except KeyError:
         return None
     try:
-        return ET.fromstring(data)
+        return ET.fromstring(data, xml_parser())
     except ET.ParseError:
         return None
 
 
-def iter_xml_parts(zf: zipfile.ZipFile) -> Iterable[Tuple[str, bytes]]:
+def iter_streamed_paragraphs(zf: zipfile.ZipFile, name: str) -> Iterable[ET._Element]:
     """
-    Iterate all XML parts under word/ (including document, headers, footers, footnotes, etc.).
+    Stream a part and yield each top-level w:p once it is complete (nested textbox paragraphs
+    stay inside it), then clear it and its already-processed preceding siblings.
     """
-    for name in zf.namelist():
-        if name.startswith("word/") and name.endswith(".xml"):
-            yield name, zf.read(name)
+    with zf.open(name) as f:
+        for _, p in ET.iterparse(f, events=("end",), tag=W_P_TAG, huge_tree=True):
+            if next(p.iterancestors(W_P_TAG), None) is not None:
+                continue
+            yield p
+            p.clear(keep_tail=True)
+            while p.getprevious() is not None:
+                del p.getparent()[0]
+
+
+def iter_part_chunks(
+    zf: zipfile.ZipFile, part_names: List[str]
+) -> Iterable[Tuple[str, Iterable[ET._Element]]]:
+    """
+    Yield (part_name, chunks) for check_part in archive order.
+    Regular parts are decompressed + parsed in a thread pool (zlib and lxml release the GIL),
+    at most PARSE_WORKERS parts ahead of the consumer; oversized parts are streamed.
+    The workers share one ZipFile on purpose: zipfile serializes access to the underlying
+    file through its internal _SharedFile lock, and every opened member keeps its own position.
+    """
+    def streamed(name: str) -> bool:
+        return zf.getinfo(name).file_size > STREAM_PART_MIN_SIZE
 
+    tree_names = iter([n for n in part_names if not streamed(n)])
+    with ThreadPoolExecutor(max_workers=PARSE_WORKERS) as ex:
+        futures: deque = deque()
 
-def build_parent_map(root: ET.Element) -> Dict[ET.Element, ET.Element]:
-    parent_map: Dict[ET.Element, ET.Element] = {}
-    for parent in root.iter():
-        for child in parent:
-            parent_map[child] = parent
-    return parent_map
+        def prefetch() -> None:
+            for name in islice(tree_names, PARSE_WORKERS - len(futures)):
+                futures.append(ex.submit(read_xml, zf, name))
 
+        for part_name in part_names:
+            if streamed(part_name):
+                yield part_name, iter_streamed_paragraphs(zf, part_name)
+                continue
+            prefetch()
+            root = futures.popleft().result()
+            prefetch()
+            yield part_name, ((root,) if root is not None else ())
 
-def has_ancestor(node: ET.Element, parent_map: Dict[ET.Element, ET.Element], tag_suffixes: List[str]) -> bool:
-    cur = node
-    while cur in parent_map:
-        cur = parent_map[cur]
-        for suf in tag_suffixes:
-            if cur.tag.endswith(suf):
-                return True
-    return False
 
+def iter_xml_parts(names: Iterable[str]) -> Iterable[str]:
+    """
+    Iterate names of all XML parts under word/ (including document, headers, footers, footnotes, etc.).
+    """
+    for name in names:
+        if name.startswith("word/") and name.endswith(".xml"):
+            yield name
 
-def paragraph_plain_text(p: ET.Element) -> str:
+
+def paragraph_plain_text(p: ET._Element) -> str:
     """
     Visible text approximation for printing diagnostics.
     """
     parts: List[str] = []
-    for r in p.findall(".//w:r", NS):
-        for t in r.findall(".//w:t", NS):
-            if t.text:
-                parts.append(t.text)
-        for child in list(r):
-            local = child.tag.split("}")[-1]
-            if local in RUN_SPECIAL_TEXT:
-                parts.append(RUN_SPECIAL_TEXT[local])
+    # One document-order walk; special elements only count as direct run children
+    # (w:tab also appears as a tab stop under w:pPr/w:tabs).
+    for el in p.iter(W_T_TAG, *RUN_SPECIAL_TEXT_BY_TAG):
+        if el.tag == W_T_TAG:
+            if el.text:
+                parts.append(el.text)
+        elif el.getparent().tag == W_R_TAG:
+            parts.append(RUN_SPECIAL_TEXT_BY_TAG[el.tag])
     return "".join(parts).strip()
 
 
-def run_text_streams(p: ET.Element) -> Tuple[List[str], List[int]]:
+def run_text_streams(p: ET._Element) -> Tuple[str, List[int]]:
     """
-    Return (run_texts, char_to_run_index).
+    Return (full_text, run_ends), where run_ends[i] is the cumulative end offset of run i;
+    the run index of character offset k is bisect_right(run_ends, k).
     Includes w:t and common special elements (tab, br, etc.) so placeholder splitting isn't missed.
     """
     run_texts: List[str] = []
-    char_to_run: List[int] = []
 
-    runs = p.findall(".//w:r", NS)
-    for run_idx, r in enumerate(runs):
+    for r in p.findall(".//w:r", NS):
         buf: List[str] = []
 
-        for child in list(r):
-            local = child.tag.split("}")[-1]
-            if local == "t":
-                if child.text:
-                    buf.append(child.text)
-            elif local in RUN_SPECIAL_TEXT:
-                buf.append(RUN_SPECIAL_TEXT[local])
-            elif local == "instrText":
+        for child in r:
+            tag = child.tag
+            if tag == W_T_TAG or tag == W_INSTR_TEXT_TAG:
                 if child.text:
                     buf.append(child.text)
+            elif tag in RUN_SPECIAL_TEXT_BY_TAG:
+                buf.append(RUN_SPECIAL_TEXT_BY_TAG[tag])
 
-        s = "".join(buf)
-        run_texts.append(s)
-        char_to_run.extend([run_idx] * len(s))
+        run_texts.append("".join(buf))
 
-    return run_texts, char_to_run
+    return "".join(run_texts), list(accumulate(map(len, run_texts)))
 
 
 def load_style_id_to_name(zf: zipfile.ZipFile) -> Dict[str, str]:
@@ -157,37 +222,38 @@ def load_style_id_to_name(zf: zipfile.ZipFile) -> Dict[str, str]:
     return m
 
 
-def resolve_paragraph_style_name(p: ET.Element, style_id_to_name: Dict[str, str]) -> Optional[str]:
-    p_style = p.find("./w:pPr/w:pStyle", NS)
-    if p_style is None:
-        return None
-    style_id = p_style.get(f"{{{NS['w']}}}val")
-    if not style_id:
-        return None
-    return style_id_to_name.get(style_id, style_id)
+def resolve_body_style_ids(style_id_to_name: Dict[str, str], body_style_names: set) -> set:
+    """
+    Resolve body style display names to styleIds once per document.
+    A styleId absent from styles.xml is matched by its raw id, as a display name would be.
+    """
+    ids = {sid for sid, name in style_id_to_name.items() if name in body_style_names}
+    ids.update(n for n in body_style_names if n not in style_id_to_name)
+    return ids
 
 
 def check_run_split_placeholders(
-    p: ET.Element,
+    p: ET._Element,
     part_name: str,
     p_index: int,
 ) -> List[dict]:
-    run_texts, char_to_run = run_text_streams(p)
-    if not run_texts:
+    # A placeholder cannot be split unless the paragraph has at least two runs
+    # (counted as descendants, like run_text_streams, so runs inside hyperlinks are included).
+    if len(list(islice(p.iter(W_R_TAG), 2))) < 2:
+        return []
+    if not PARAGRAPH_HAS_BRACE(p):
+        return []
+    full_text, run_ends = run_text_streams(p)
+    if not full_text:
         return []
-    full_text = "".join(run_texts)
-    if ("{{" not in full_text and "{%" not in full_text and "{#" not in full_text) or (
-        "}}" not in full_text and "%}" not in full_text and "#}" not in full_text
-    ):
+    if not PLACEHOLDER_PREFILTER_RE.search(full_text):
         return []
 
     issues: List[dict] = []
     for m in PLACEHOLDER_RE.finditer(full_text):
         start, end = m.span()
-        if start >= len(char_to_run) or end - 1 >= len(char_to_run):
-            continue
-        run_start = char_to_run[start]
-        run_end = char_to_run[end - 1]
+        run_start = bisect_right(run_ends, start)
+        run_end = bisect_right(run_ends, end - 1)
         if run_start != run_end:
             issues.append(
                 {
@@ -204,39 +270,38 @@ def check_run_split_placeholders(
 
 
 def check_body_style_location(
-    p: ET.Element,
+    p: ET._Element,
     part_name: str,
     p_index: int,
-    parent_map: Dict[ET.Element, ET.Element],
     style_id_to_name: Dict[str, str],
-    body_style_names: set,
+    body_style_ids: set,
 ) -> Optional[dict]:
-    style_name = resolve_paragraph_style_name(p, style_id_to_name)
-    if style_name is None or style_name not in body_style_names:
+    style_id = PARAGRAPH_STYLE_ID(p)
+    if style_id not in body_style_ids:
         return None
-    if not has_ancestor(p, parent_map, ["hdr", "ftr", "tbl", "txbxContent"]):
+    if next(p.iterancestors(*BODY_STYLE_BAD_CONTAINER_TAGS), None) is None:
         return None
 
     return {
         "type": "BODY_STYLE_LOCATION",
         "part": part_name,
         "p_index": p_index,
-        "style": style_name,
+        "style": style_id_to_name.get(style_id, style_id),
         "location": "header/footer/table/textbox",
         "text": paragraph_plain_text(p) or "[空段落]",
     }
 
 
-def check_external_rels(zf: zipfile.ZipFile) -> List[dict]:
+def check_external_rels(zf: zipfile.ZipFile, names: Iterable[str]) -> List[dict]:
     issues: List[dict] = []
-    for name in zf.namelist():
+    for name in names:
         if not name.startswith("word/_rels/") or not name.endswith(".rels"):
             continue
         try:
-            root = ET.fromstring(zf.read(name))
+            root = ET.fromstring(zf.read(name), xml_parser())
         except ET.ParseError:
             continue
-        for rel in root.findall(".//{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"):
+        for rel in root.iterfind(RELATIONSHIP_TAG):
             target_mode = rel.get("TargetMode")
             target = rel.get("Target")
             if target_mode == "External":
@@ -244,46 +309,63 @@ def check_external_rels(zf: zipfile.ZipFile) -> List[dict]:
     return issues
 
 
-def check_external_fields(root: ET.Element, part_name: str) -> List[dict]:
+def check_external_fields(root: ET._Element, part_name: str) -> List[dict]:
     issues: List[dict] = []
-    for instr in root.findall(".//w:instrText", NS):
+    for instr in root.iter(W_INSTR_TEXT_TAG):
         text = instr.text or ""
-        upper = text.upper()
-        if any(k in upper for k in EXTERNAL_FIELD_KEYWORDS):
+        if EXTERNAL_FIELD_RE.search(text):
             issues.append({"type": "FIELD_EXTERNAL", "part": part_name, "text": text.strip()})
     return issues
 
 
 def check_embedded_objects(part_name: str) -> Optional[dict]:
-    if part_name.startswith("word/embeddings/") or part_name.startswith("word/activeX/"):
+    if part_name.startswith(EMBEDDED_PART_PREFIXES):
         return {"type": "EMBEDDED_OBJECT", "part": part_name}
     return None
 
 
+def check_part(
+    chunks: Iterable[ET._Element],
+    part_name: str,
+    style_id_to_name: Dict[str, str],
+    body_style_ids: set,
+) -> List[dict]:
+    """
+    Run paragraph and field checks over a part given as chunks: either its whole root,
+    or its top-level paragraphs one at a time. Paragraph indices and issue order are the same either way.
+    """
+    issues: List[dict] = []
+    field_issues: List[dict] = []
+    idx = 0
+    for chunk in chunks:
+        for p in chunk.iter(W_P_TAG):
+            issues.extend(check_run_split_placeholders(p, part_name, idx))
+            body_issue = check_body_style_location(p, part_name, idx, style_id_to_name, body_style_ids)
+            if body_issue:
+                issues.append(body_issue)
+            idx += 1
+        field_issues.extend(check_external_fields(chunk, part_name))
+    return issues + field_issues
+
+
 def run_checks(docx: Path, mode: str, body_style_names: set, max_issues: int) -> int:
     issues: List[dict] = []
 
     with zipfile.ZipFile(docx, "r") as zf:
+        names = zf.namelist()
         style_id_to_name = load_style_id_to_name(zf)
+        body_style_ids = resolve_body_style_ids(style_id_to_name, body_style_names)
         if mode in ("template", "all"):
-            for part_name, data in iter_xml_parts(zf):
-                root = read_xml(zf, part_name)
-                if root is None:
+            for part_name, chunks in iter_part_chunks(zf, list(iter_xml_parts(names))):
+                try:
+                    issues.extend(check_part(chunks, part_name, style_id_to_name, body_style_ids))
+                except ET.ParseError:
                     continue
-                parent_map = build_parent_map(root)
-                for idx, p in enumerate(root.findall(".//w:p", NS)):
-                    issues.extend(check_run_split_placeholders(p, part_name, idx))
-                    body_issue = check_body_style_location(
-                        p, part_name, idx, parent_map, style_id_to_name, body_style_names
-                    )
-                    if body_issue:
-                        issues.append(body_issue)
-                issues.extend(check_external_fields(root, part_name))
 
         if mode in ("output", "all"):
-            issues.extend(check_external_rels(zf))
+            issues.extend(check_external_rels(zf, names))
 
-        for name in zf.namelist():
+        for name in names:
             embedded = check_embedded_objects(name)
             if embedded:
                 issues.append(embedded)